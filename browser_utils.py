@@ -0,0 +1,12 @@
+# browser_utils.py
+from __future__ import annotations
+from playwright.async_api import Route
+from config import BLOCKED_RESOURCE_TYPES
+
+
+async def block_resources(route: Route) -> None:
+    """page.route handler: abort images/fonts/media; both portals only need the DOM, XHRs and PDFs."""
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
@@ -2,12 +2,16 @@ from pathlib import Path
 
 # Base URLs
 PGFN_BASE = "https://www.listadevedores.pgfn.gov.br"
+PGFN_API = f"{PGFN_BASE}/api"
 REGULARIZE_BASE = "https://www.regularize.pgfn.gov.br"
 REGULARIZE_DOC = f"{REGULARIZE_BASE}/docArrecadacao"
 
 # Heuristics / URL fragments to watch in XHR
 PGFN_JSON_HINTS = ["/api/devedores", "api/devedores", "devedores/", "devedores"]
 
+# Resource types aborted via page.route (stylesheets are kept: modals/visibility depend on them)
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+
 # Output defaults
 DEFAULT_OUT_DIR = Path("./out")
 DEFAULT_DB_PATH = Path("./data.sqlite")
@@ -27,6 +31,13 @@ STORAGE_PATH = Path("./playwright_state.json")
 # Select browser
 BROWSER = "chromium"  # choose from: chromium, firefox, webkit
 
+# Max concurrent direct detail GETs per search
+DETAIL_CONCURRENCY = 4
+# Max queries searched at once (one PGFN page each)
+SEARCH_CONCURRENCY = 2
+# Max DARFs emitted at once (one Regularize page each)
+DARF_CONCURRENCY = 4
+
 # Timeouts (ms)
 WAIT_LONG = 30_000
 WAIT_MED = 10_000
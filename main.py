@@ -4,10 +4,10 @@ import argparse, re, logging, asyncio, os, sys
 from pathlib import Path
 from typing import Optional
 from playwright.async_api import async_playwright, BrowserContext
-from config import DEFAULT_OUT_DIR, DEFAULT_DB_PATH, DEFAULT_DOWNLOAD_DIR
-from pgfn_client import PGFNClient
+from config import DEFAULT_OUT_DIR, DEFAULT_DB_PATH, DEFAULT_DOWNLOAD_DIR, SEARCH_CONCURRENCY
+from pgfn_client import PGFNClient, DebtorRow, StealthState
 from regularize_client import RegularizeClient
-from storage import Inscription, save_as_csv_json, init_db, upsert_inscriptions, link_darf
+from storage import Inscription, save_as_csv_json, init_db, upsert_inscriptions, link_darfs
 
 # Bright Data Scraping Browser over CDP
 BRIGHTDATA_AUTH = "brd-customer-hl_77272cb6-zone-pgfn:t6oeei7qixhv"
@@ -29,7 +29,50 @@ async def _connect_brightdata() -> tuple[BrowserContext, object, object]:
     logging.info("[CTX] Bright Data browser connected (hCaptcha bypass handled upstream).")
     return context, browser, pw
 
-async def run(query: str, out_dir: Path, db_path: Path, download_dir: Path):
+async def _search_all(ctx: BrowserContext, queries: list[str]) -> list[DebtorRow]:
+    """
+    Work the queries through SEARCH_CONCURRENCY PGFNClient pages, each opened once and reused.
+    Debtors found by several queries are kept once (first seen wins, in query order).
+    """
+    stealth = StealthState()  # escalation carries across queries
+    queue: asyncio.Queue = asyncio.Queue()
+    for q in queries:
+        queue.put_nowait(q)
+    found: dict[str, list[DebtorRow]] = {}
+
+    async def _worker() -> None:
+        pgfn = PGFNClient(ctx, stealth)
+        try:
+            await pgfn.open()
+            await pgfn.check_hcaptcha()
+            while not queue.empty():
+                query = queue.get_nowait()
+                try:
+                    found[query] = await pgfn.search_company(query)
+                    logging.info("Found %d debtor rows for '%s'.", len(found[query]), query)
+                except Exception as e:
+                    # One bad query must not sink the others' results
+                    logging.warning("Search failed for '%s': %s", query, e)
+        finally:
+            await pgfn.close()
+
+    outcomes = await asyncio.gather(
+        *(_worker() for _ in range(min(SEARCH_CONCURRENCY, len(queries)))), return_exceptions=True
+    )
+    for res in outcomes:
+        if isinstance(res, BaseException):
+            # e.g. a goto timeout in open(): the other pages drain the remaining queries
+            logging.warning("PGFN search page failed: %s", res)
+    if not queue.empty():
+        logging.warning("%d queries were not searched (no PGFN page available).", queue.qsize())
+
+    unique: dict[str, DebtorRow] = {}
+    for query in queries:
+        for d in found.get(query, []):
+            unique.setdefault(only_digits(d.cnpj), d)
+    return list(unique.values())
+
+async def run(queries: list[str], out_dir: Path, db_path: Path, download_dir: Path):
     ctx: Optional[BrowserContext] = None
     browser = None
     pw = None
@@ -41,14 +84,8 @@ async def run(query: str, out_dir: Path, db_path: Path, download_dir: Path):
         ctx, browser, pw = await _connect_brightdata()
 
         # --- PGFN flow ---
-        pgfn = PGFNClient(ctx)
-        await pgfn.open()
-        
-        await pgfn.check_hcaptcha()
-
-        # Perform search and get all CNPJs + inscriptions
-        debtors = await pgfn.search_company(query)
-        logging.info("Found %d debtor rows for '%s'.", len(debtors), query)
+        # Perform search(es) and get all CNPJs + inscriptions
+        debtors = await _search_all(ctx, queries)
 
         # Save to CSV/JSON
         save_as_csv_json(debtors, out_dir)
@@ -68,16 +105,19 @@ async def run(query: str, out_dir: Path, db_path: Path, download_dir: Path):
         # --- Regularize flow ---
         reg = RegularizeClient(ctx, download_dir)
         await reg.open()
-        for d in debtors:
-            for ins in (d.inscriptions or []):
-                try:
-                    pdf_path = await reg.emitir_darf_integral(
-                        only_digits(d.cnpj), ins
-                    )
-                    logging.info(f"Saved DARF: {pdf_path}")
-                    link_darf(db_engine, d.cnpj, ins, pdf_path)
-                except Exception as err:
-                    logging.warning(f"DARF failed for {d.cnpj} - {ins}: {err}")
+        pairs = [(d.cnpj, ins) for d in debtors for ins in (d.inscriptions or [])]
+        try:
+            results = await reg.emitir_batch([(only_digits(cnpj), ins) for cnpj, ins in pairs])
+        finally:
+            await reg.close()
+        links = []
+        for (cnpj, ins), res in zip(pairs, results):
+            if isinstance(res, Exception):
+                logging.warning(f"DARF failed for {cnpj} - {ins}: {res}")
+                continue
+            logging.info(f"Saved DARF: {res}")
+            links.append((cnpj, ins, res))
+        link_darfs(db_engine, links)
 
     except Exception as main_err:
         logging.critical("[FATAL] Unhandled error in run(): %s", main_err, exc_info=True)
@@ -111,7 +151,7 @@ if __name__ == "__main__":
     )
 
     parser = argparse.ArgumentParser("PGFN search + DARF via Bright Data (hCaptcha-free)")
-    parser.add_argument("--query", required=True, help="Search company name")
+    parser.add_argument("--query", required=True, action="append", help="Search company name (repeat for several)")
     parser.add_argument("--out-dir", default=str(DEFAULT_OUT_DIR))
     parser.add_argument("--db", default=str(DEFAULT_DB_PATH))
     parser.add_argument("--download-dir", default=str(DEFAULT_DOWNLOAD_DIR))
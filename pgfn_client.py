@@ -1,39 +1,137 @@
 # pgfn_client.py
 from __future__ import annotations
-import logging, random, math, asyncio
-from typing import List, Dict, Any, Optional
+import logging, random, math, asyncio, re
+from urllib.parse import urlencode
+import orjson
+from typing import List, Dict, Optional, Iterable
 from dataclasses import dataclass
-from playwright.async_api import BrowserContext, Page, Route
-from config import PGFN_BASE, WAIT_LONG
+from functools import lru_cache
+from playwright.async_api import BrowserContext, Page, Route, Locator
+from config import PGFN_BASE, PGFN_API, WAIT_LONG, DETAIL_CONCURRENCY
+from browser_utils import block_resources
 
 logger = logging.getLogger("PGFNClient")
 
 
-@dataclass
+@dataclass(slots=True)
 class DebtorRow:
     cnpj: str
     inscriptions: Optional[List[str]] = None  # new field
 
 
+# Bodies at least this large are parsed in a worker thread to keep the event loop free
+_THREAD_EXTRACT_MIN_BYTES = 256 * 1024
+_CNPJ_TEXT_RE = re.compile(r"\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2}")
+_NON_DIGITS_RE = re.compile(r"\D+")
+
+_NAME_INPUT_SEL = "input#nome, input[formcontrolname='nome']"
+_CONSULT_BTN_SEL = "button:has-text('Consultar'), button.btn.btn-warning"
+_ROW_SEL = "table tbody tr"
+_DETAIL_BTN_SEL = "i.ion-ios-open, button[title*='Detalhar']"
+_MODAL_CLOSE_SEL = "button.close, .modal .btn-close"
+# One round-trip for every row's text and whether it has a Detalhar button
+_ROWS_INFO_JS = """
+(rows, btnSel) => rows.map(r => ({
+    text: r.innerText || '',
+    hasBtn: !!r.querySelector(btnSel),
+}))
+"""
+
+
+def _extract_detail(body: bytes) -> tuple[str, List[str]]:
+    """Return (cnpj, inscriptions) from a raw /api/devedores?id= response body."""
+    data = orjson.loads(body)
+    cnpj = str(data.get("id") or "").strip()
+    inscriptions: List[str] = []
+    for nat in data.get("naturezas", []) or []:
+        for deb in nat.get("debitos", []) or []:
+            if deb.get("numero"):
+                inscriptions.append(str(deb["numero"]).strip())
+    return cnpj, inscriptions
+
+
+async def _parse_detail(body: bytes) -> tuple[str, List[str]]:
+    """_extract_detail, moved to a worker thread for large bodies."""
+    if len(body) >= _THREAD_EXTRACT_MIN_BYTES:
+        return await asyncio.to_thread(_extract_detail, body)
+    return _extract_detail(body)
+
+
+@lru_cache(maxsize=64)
+def _bezier_basis(steps: int) -> tuple[tuple[float, float, float, float], ...]:
+    """Cubic Bézier (Bernstein) weights for t = 0..1 in `steps` increments."""
+    basis = []
+    for i in range(steps + 1):
+        t = i / steps
+        u = 1 - t
+        basis.append((u * u * u, 3 * u * u * t, 3 * u * t * t, t * t * t))
+    return tuple(basis)
+
+
+def _is_devedores_response(r) -> bool:
+    """expect_response predicate for the search API (PGFN URLs are lower-case)."""
+    return "/api/devedores" in r.url
+
+
+# Detail GET issued from inside the page, so it leaves through the browser's
+# network stack (and the remote browser's proxy/session), not the local driver.
+_FETCH_DETAIL_JS = """
+async ([url, token]) => {
+    const r = await fetch(url, {headers: {authorization: token}, credentials: 'include'});
+    return {status: r.status, body: r.ok ? await r.text() : null};
+}
+"""
+
+
+# Installed before any page script: pushes the SPA's Authorization token to
+# Python whenever it is written to local/sessionStorage.
+_AUTH_HOOK_JS = """
+(() => {
+    const orig = Storage.prototype.setItem;
+    Storage.prototype.setItem = function (k, v) {
+        if (k === 'Authorization' && window.__authChanged) window.__authChanged(v);
+        return orig.call(this, k, v);
+    };
+})();
+"""
+
+
+# Brazilian number format: drop thousands dots, decimal comma -> dot
+_BR_NUMBER_TRANS = str.maketrans({'.': None, ',': '.'})
+
+
 def _to_float_safe(val) -> Optional[float]:
     if val is None:
         return None
     try:
         if isinstance(val, (int, float)):
             return float(val)
-        s = str(val).strip()
-        s = s.replace('.', '').replace(',', '.')
-        return float(s)
+        return float(str(val).strip().translate(_BR_NUMBER_TRANS))
     except Exception:
         return None
 
 
+@dataclass(slots=True)
+class StealthState:
+    """Anti-bot escalation shared by every PGFNClient of a run."""
+    # 0 = plain fill/click; bumped on 401/403 or hCaptcha to enable the human-like helpers
+    level: int = 0
+
+
 class PGFNClient:
-    def __init__(self, context: BrowserContext):
+    def __init__(self, context: BrowserContext, stealth: Optional[StealthState] = None):
         self.context = context
         self.page: Optional[Page] = None
-        self._last_detail_json: Optional[Dict[str, Any]] = None
+        self._detail_future: Optional[asyncio.Future] = None  # resolved by the response listener
         self._auth_token: Optional[str] = None  # cache token
+        self._searched = False  # page shows an earlier query's results
+        # Pass one StealthState to all clients so pushback on one query carries over to the next
+        self._stealth = stealth if stealth is not None else StealthState()
+        # Locators built once per page in open()
+        self._name_input: Optional[Locator] = None
+        self._consult_btn: Optional[Locator] = None
+        self._rows: Optional[Locator] = None
+        self._modal_close: Optional[Locator] = None
 
     # --- Human-like helpers ---
     async def _human_mouse_curve(self, page, start, end, steps=30, jitter=3):
@@ -47,21 +145,21 @@ class PGFNClient:
         cx2 = start[0] + (end[0] - start[0]) * random.uniform(0.5, 0.8) + random.randint(-40, 40)
         cy2 = start[1] + (end[1] - start[1]) * random.uniform(0.5, 0.8) + random.randint(-40, 40)
 
-        for t in [i / steps for i in range(steps + 1)]:
-            # Cubic Bézier interpolation
-            x = (1-t)**3 * start[0] + 3*(1-t)**2 * t * cx1 + 3*(1-t) * t**2 * cx2 + t**3 * end[0]
-            y = (1-t)**3 * start[1] + 3*(1-t)**2 * t * cy1 + 3*(1-t) * t**2 * cy2 + t**3 * end[1]
-
-            # Add jitter (tiny natural micro-movements)
-            x += random.uniform(-jitter, jitter)
-            y += random.uniform(-jitter, jitter)
+        # Cubic Bézier interpolation + jitter (tiny natural micro-movements), built up front
+        uniform = random.uniform
+        points = [
+            (b0 * start[0] + b1 * cx1 + b2 * cx2 + b3 * end[0] + uniform(-jitter, jitter),
+             b0 * start[1] + b1 * cy1 + b2 * cy2 + b3 * end[1] + uniform(-jitter, jitter))
+            for b0, b1, b2, b3 in _bezier_basis(steps)
+        ]
 
+        for x, y in points:
             await page.mouse.move(x, y)
             await asyncio.sleep(random.uniform(0.005, 0.02))  # natural reaction delay
 
-    async def _human_type(self, p: Page, selector: str, text: str) -> None:
+    async def _human_type(self, p: Page, target: Locator, text: str) -> None:
         """Type text with natural variable delays, occasional backspaces and small hesitations."""
-        await p.focus(selector)
+        await target.focus()
         await asyncio.sleep(random.uniform(0.05, 0.6))
         typed = ""
         for ch in text:
@@ -95,30 +193,105 @@ class PGFNClient:
             pass
 
     async def _bulletproof_click(self, selector: str, label: str) -> bool:
-        """Try multiple strategies to click a button reliably."""
+        """Try multiple strategies to click a button reliably, with short escalating timeouts."""
         assert self.page is not None
         p = self.page
         try:
-            await p.click(selector)
+            await p.locator(selector).first.wait_for(state="visible", timeout=1500)
+        except Exception:
+            logger.debug("[CLICK] %s not visible yet, trying anyway", label)
+        try:
+            await p.click(selector, timeout=3000)
             logger.info("[CLICK] %s (normal)", label)
             return True
         except Exception as e1:
             logger.warning("[CLICK] Normal click failed on %s: %s", label, e1)
             try:
-                await p.click(selector, force=True)
+                await p.click(selector, force=True, timeout=5000)
                 logger.info("[CLICK] %s (force)", label)
                 return True
             except Exception as e2:
                 logger.error("[CLICK] Force click failed on %s: %s", label, e2)
         return False
 
+    async def _on_response(self, resp) -> None:
+        """Page-wide response hook: track the auth token and resolve the pending detail future."""
+        url = resp.url
+        if "/api/devedores" not in url:
+            # Static assets and other XHRs: nothing to read, not even headers
+            return
+        try:
+            hdrs = resp.headers  # Playwright already lower-cases header names
+            if "authorization" in hdrs:
+                self._auth_token = hdrs["authorization"]
+                logger.debug("[AUTH] token updated from response header (authorization)")
+            # elif "total-control" in hdrs:
+                # self._auth_token = hdrs["total-control"]
+                # logger.info("[AUTH] token updated from response header (total-control)")
+            if "/api/devedores?id=" in url:
+                fut = self._detail_future
+                if fut is not None and not fut.done():
+                    try:
+                        fut.set_result(await resp.body())
+                    except Exception as e:
+                        if not fut.done():
+                            fut.set_exception(e)
+
+                if logger.isEnabledFor(logging.DEBUG):
+                    req = resp.request
+                    logger.debug("[REQ] %s %s headers=%s", req.method, req.url, req.headers)
+                    logger.debug("[RESP] %s %s headers=%s", resp.status, resp.url, resp.headers)
+
+        except Exception as e:
+            logger.debug("[XHR] response listener error: %s", e)
+
+    async def _inject_auth(self, route: Route) -> None:
+        """Add the current cached token to /api/devedores requests."""
+        try:
+            if self._auth_token:
+                await route.continue_(headers={**route.request.headers, "authorization": self._auth_token})
+            else:
+                await route.continue_()
+        except Exception as e:
+            logger.debug("[ROUTE] continue_ failed: %s", e)
+            await route.continue_()
+
     async def open(self):
         """Open PGFN site."""
         self.page = await self.context.new_page()
         self.page.set_default_timeout(WAIT_LONG)
+        await self.page.route("**/*", block_resources)
+        await self.page.route("**/api/devedores*", self._inject_auth)
+        self.page.on("response", self._on_response)
+        self._name_input = self.page.locator(_NAME_INPUT_SEL)
+        self._consult_btn = self.page.locator(_CONSULT_BTN_SEL).first
+        self._rows = self.page.locator(_ROW_SEL)
+        self._modal_close = self.page.locator(_MODAL_CLOSE_SEL).first
+        await self.page.expose_function("__authChanged", self._on_auth_changed)
+        await self.page.add_init_script(_AUTH_HOOK_JS)
         logger.info("[PGFN] Opening base page: %s", PGFN_BASE)
         await self.page.goto(PGFN_BASE, wait_until="domcontentloaded")
         logger.info("[PGFN] Base page loaded.")
+        if not self._auth_token:
+            # A token persisted by an earlier session is never re-written, so read it once
+            try:
+                self._auth_token = await self.page.evaluate(
+                    "() => (window.localStorage.getItem('Authorization') || window.sessionStorage.getItem('Authorization') || null)"
+                )
+            except Exception:
+                pass
+
+    async def close(self):
+        """Close the PGFN page."""
+        if self.page is not None:
+            await self.page.close()
+            self.page = None
+
+    def _on_auth_changed(self, token: str) -> None:
+        """Called from the page (via _AUTH_HOOK_JS) whenever the SPA stores a new token."""
+        if token:
+            self._auth_token = token
+            logger.debug("[AUTH] token pushed from page storage")
         
     async def check_hcaptcha(self) -> bool:
         try:
@@ -134,6 +307,7 @@ class PGFNClient:
                 return False
         
             logger.warning("[PGFN] hCaptcha still detected.")
+            self._stealth.level = max(self._stealth.level, 1)
     
         except Exception as e:
             logger.error(f"[PGFN] Error checking for hCaptcha: {str(e)}")
@@ -142,95 +316,151 @@ class PGFNClient:
         # cookies = await self.context.cookies()
         # logger.info("[PGFN] Got %d cookies for session", len(cookies))
 
+    async def _human_approach(self, p: Page, detail_btn: Locator) -> None:
+        """Scroll, hesitate and curve the mouse onto a row's Detalhar button."""
+        # --- Human-like pre-scroll before interacting ---
+        await self._human_scroll_and_view(p)
+        await asyncio.sleep(random.uniform(0.4, 1.6))  # pause as if reading row details
+
+        # Move mouse off-row and back (like repositioning to focus)
+        viewport = p.viewport_size
+        if viewport:
+            await p.mouse.move(viewport["width"] + random.randint(10, 60),
+                               random.randint(40, viewport["height"] - 40))
+            await asyncio.sleep(random.uniform(0.25, 0.9))
+
+        # Get button box
+        box = await detail_btn.bounding_box()
+        if box:
+            # Start from current "neutral" center position
+            cur = await p.evaluate(
+                "() => ({x: window.scrollX + (window.innerWidth/2), y: window.scrollY + (window.innerHeight/2)})"
+            )
+            target = (box["x"] + box["width"] / 2, box["y"] + box["height"] / 2)
+
+            # Random exploratory hovers around the button edges (human hesitation)
+            for _ in range(random.randint(1, 3)):
+                hover_x = box["x"] + random.uniform(0, box["width"])
+                hover_y = box["y"] + random.uniform(0, box["height"])
+                await p.mouse.move(hover_x, hover_y, steps=random.randint(6, 12))
+                await asyncio.sleep(random.uniform(0.2, 0.7))
+
+            # Overshoot path then correction
+            overshoot = (
+                target[0] + random.uniform(-6, 12),
+                target[1] + random.uniform(-6, 12),
+            )
+            await self._human_mouse_curve(p, (cur["x"], cur["y"]), overshoot,
+                                          steps=random.randint(14, 28))
+            await asyncio.sleep(random.uniform(0.5, 2.0))
+            await self._human_mouse_curve(p, overshoot, target,
+                                          steps=random.randint(6, 12))
+
+            # Pause like “reading tooltip” before committing
+            await asyncio.sleep(random.uniform(0.6, 2.4))
+
+    async def _detail_via_modal(self, p: Page, detail_btn: Locator, idx: int) -> Optional[bytes]:
+        """Open the row's Detalhar modal and return the detail XHR body."""
+        if self._stealth.level:
+            await self._human_approach(p, detail_btn)
+
+        # Arm the future right before the click so a late response
+        # from the previous row cannot resolve it
+        self._detail_future = asyncio.get_running_loop().create_future()
+        await detail_btn.click()
+
+        if self._stealth.level:
+            # Post-click behaviors: simulate viewing modal
+            await asyncio.sleep(random.uniform(0.5, 1.5))
+            await self._human_scroll_and_view(p)
+            await asyncio.sleep(random.uniform(0.3, 0.8))
+        try:
+            body = await asyncio.wait_for(self._detail_future, timeout=20)
+            logger.debug("[DETAIL] API responded for row %s", idx)
+        except asyncio.TimeoutError:
+            logger.error("[DETAIL] timeout waiting for /api/devedores?id= (row %s)", idx)
+            return None
+        except Exception as e:
+            logger.warning("[DETAIL] failed to read /api/devedores?id= body: %s", e)
+            return None
+        finally:
+            self._detail_future = None
+            await self._close_detail_modal(p)
+        return body
+
+    async def _close_detail_modal(self, p: Page) -> None:
+        """Dismiss the Detalhar modal if it is open."""
+        if await self._modal_close.count():
+            await self._modal_close.click()
+            await asyncio.sleep(random.uniform(0.2, 0.9))
+
+    async def _fetch_detail(self, cnpj_digits: str) -> Optional[bytes]:
+        """GET the detail JSON from the page with the cached token; None means fall back to the modal."""
+        if not self._auth_token:
+            return None
+        try:
+            url = f"{PGFN_API}/devedores?{urlencode({'id': cnpj_digits})}"
+            resp = await self.page.evaluate(_FETCH_DETAIL_JS, [url, self._auth_token])
+            if resp["body"] is None:
+                logger.debug("[DETAIL] direct GET %s -> %s, falling back to modal", cnpj_digits, resp["status"])
+                return None
+            return resp["body"].encode()
+        except Exception as e:
+            logger.debug("[DETAIL] direct GET failed for %s: %s", cnpj_digits, e)
+            return None
+
+    async def _fetch_details(self, cnpjs: Iterable[str]) -> Dict[str, Optional[bytes]]:
+        """Run _fetch_detail for each distinct CNPJ, at most DETAIL_CONCURRENCY at a time."""
+        sem = asyncio.Semaphore(DETAIL_CONCURRENCY)
+        unique = list(dict.fromkeys(cnpjs))
+
+        async def _one(cnpj_digits: str) -> Optional[bytes]:
+            async with sem:
+                return await self._fetch_detail(cnpj_digits)
+
+        bodies = await asyncio.gather(*(_one(c) for c in unique), return_exceptions=True)
+        return {c: (None if isinstance(b, BaseException) else b) for c, b in zip(unique, bodies)}
+
     async def search_company(self, name_query: str, max_attempts: int = 3) -> List[DebtorRow]:
         """
         Perform search (human-like) and reliably fetch /api/devedores response.
-        Retries on 401 by attempting to refresh the token (via responses / localStorage / reloading).
+        Retries on 401 by attempting to refresh the token (via response headers / storage push / reloading).
         """
         assert self.page is not None
         p = self.page
+        if self._searched:
+            # Reused page: reload so the rows and info panel read below belong to this query
+            await p.goto(PGFN_BASE, wait_until="domcontentloaded")
+        self._searched = True
 
-        async def _extract_token_from_storage() -> Optional[str]:
-            try:
-                token = await p.evaluate(
-                    "() => (window.localStorage.getItem('Authorization') || window.sessionStorage.getItem('Authorization') || null)"
-                )
-                return token
-            except Exception:
-                return None
-
+        escalated = False  # set once this search met pushback; only clean searches relax the level
         attempt = 0
         while attempt < max_attempts:
             attempt += 1
             logger.info("[SEARCH] attempt %s/%s for query=%s", attempt, max_attempts, name_query)
 
-            try:
-                await p.unroute("**/api/devedores*")
-            except Exception:
-                pass
-            try:
-                await p.off("response", getattr(self, "_response_listener"))
-            except Exception:
-                pass
-
-            async def _response_listener(resp):
-                try:
-                    url = resp.url.lower()
-                    if "api/devedores" in url:
-                        hdrs = {k.lower(): v for k, v in resp.headers.items()}
-                        if "authorization" in hdrs:
-                            self._auth_token = hdrs["authorization"]
-                            logger.info("[AUTH] token updated from response header (authorization)")
-                        # elif "total-control" in hdrs:
-                            # self._auth_token = hdrs["total-control"]
-                            # logger.info("[AUTH] token updated from response header (total-control)")
-                        if "/api/devedores?id=" in url:
-                            
-                            # Make simple dict copies (headers may be a case-insensitive mapping)
-                            req_headers = {k: v for k, v in req.headers.items()}
-                            resp_headers = {k: v for k, v in resp.headers.items()}
-
-                            logger.debug("[REQ] %s %s headers=%s", req.method, req.url, req_headers)
-                            logger.debug("[RESP] %s %s headers=%s", resp.status, resp.url, resp_headers)
-        
-                except Exception as e:
-                    logger.debug("[XHR] response listener error: %s", e)
-
-            p.on("response", _response_listener)
-            self._response_listener = _response_listener
-
-            async def _route_handler(route: Route):
-                try:
-                    req = route.request
-                    headers = req.headers.copy()
-                    if self._auth_token:
-                        headers["authorization"] = self._auth_token
-                    await route.continue_(headers=headers)
-                except Exception as e:
-                    logger.debug("[ROUTE] continue_ failed: %s", e)
-                    await route.continue_()
-
-            await p.route("**/api/devedores*", _route_handler)
-
-            await self._human_scroll_and_view(p)
+            if self._stealth.level:
+                await self._human_scroll_and_view(p)
 
-            await asyncio.sleep(random.uniform(0.5, 1.5))  # pause as if reading
+                await asyncio.sleep(random.uniform(0.5, 1.5))  # pause as if reading
 
-            viewport = p.viewport_size
-            if viewport:
-                await p.mouse.move(viewport["width"] + random.randint(20, 80),
-                                   random.randint(50, viewport["height"] - 50))
-                await asyncio.sleep(random.uniform(0.3, 1.0))
+                viewport = p.viewport_size
+                if viewport:
+                    await p.mouse.move(viewport["width"] + random.randint(20, 80),
+                                       random.randint(50, viewport["height"] - 50))
+                    await asyncio.sleep(random.uniform(0.3, 1.0))
 
-            await self._human_type(p, "input#nome, input[formcontrolname='nome']", name_query)
-            await asyncio.sleep(random.uniform(0.6, 1.8))  # hesitation
+                await self._human_type(p, self._name_input, name_query)
+                await asyncio.sleep(random.uniform(0.6, 1.8))  # hesitation
+            else:
+                await self._name_input.fill(name_query)
 
-            btn = await p.query_selector("button:has-text('Consultar'), button.btn.btn-warning")
-            if not btn:
+            btn = self._consult_btn
+            if not await btn.count():
                 logger.error("[SEARCH] Consultar button not found")
                 return []
 
-            box = await btn.bounding_box()
+            box = await btn.bounding_box() if self._stealth.level else None
             if box:
                 # Random exploratory hovers around the button
                 for _ in range(random.randint(1, 2)):
@@ -247,8 +477,7 @@ class PGFNClient:
                 await asyncio.sleep(random.uniform(0.25, 0.8))  # hover pause before click
 
             try:
-                async with p.expect_response(lambda r: "/api/devedores" in r.url.lower(),
-                                             timeout=30000) as resp_ctx:
+                async with p.expect_response(_is_devedores_response, timeout=30000) as resp_ctx:
                     await btn.click()
                 resp = await resp_ctx.value
             except Exception as e:
@@ -262,27 +491,27 @@ class PGFNClient:
 
             logger.info("[SEARCH] API responded %s for %s", resp.status, resp.url)
 
+            if resp.status in (401, 403):
+                self._stealth.level += 1
+                escalated = True
+                logger.info("[SEARCH] %s -> stealth level %d", resp.status, self._stealth.level)
+
             if resp.status == 401:
                 logger.warning("[SEARCH] 401 -> refreshing token (attempt %s/%s)", attempt, max_attempts)
-                hdrs = {k.lower(): v for k, v in resp.headers.items()}
+                hdrs = resp.headers  # Playwright already lower-cases header names
                 new_token = hdrs.get("authorization") or hdrs.get("total-control")
                 if new_token:
                     self._auth_token = new_token
                     logger.info("[AUTH] refreshed token from response headers")
                     continue
-                store_token = await _extract_token_from_storage()
-                if store_token:
-                    self._auth_token = store_token
-                    logger.info("[AUTH] refreshed token from local/sessionStorage")
+                sent_token = resp.request.headers.get("authorization")
+                if self._auth_token and self._auth_token != sent_token:
+                    logger.info("[AUTH] using token pushed from local/sessionStorage")
                     continue
                 if attempt < max_attempts:
                     logger.info("[SEARCH] Reloading page to force token refresh...")
                     await p.goto(PGFN_BASE, wait_until="domcontentloaded")
                     await asyncio.sleep(random.uniform(0.5, 1.5))
-                    maybe = await _extract_token_from_storage()
-                    if maybe:
-                        self._auth_token = maybe
-                        logger.info("[AUTH] got token after reload")
                     continue
                 logger.error("[SEARCH] exhausted attempts -> 401")
                 return []
@@ -292,103 +521,60 @@ class PGFNClient:
                     await p.wait_for_selector("p.total-mensagens.info-panel", timeout=60000)
                 except Exception:
                     pass
-                rows = await p.query_selector_all("table tbody tr")
+                rows = await self._rows.evaluate_all(_ROWS_INFO_JS, _DETAIL_BTN_SEL)
                 logger.info("[SEARCH] Found %d rows", len(rows))
 
-                debtors: List[DebtorRow] = []
+                # Row index -> CNPJ digits read from the row text ("" when not shown)
+                row_keys: Dict[int, str] = {}
                 for idx, row in enumerate(rows, 1):
-                    try:
-                        detail_btn = await row.query_selector("i.ion-ios-open, button[title*='Detalhar']")
-                        if not detail_btn:
-                            continue
+                    if row["hasBtn"]:
+                        m = _CNPJ_TEXT_RE.search(row["text"])
+                        row_keys[idx] = _NON_DIGITS_RE.sub("", m.group(0)) if m else ""
+
+                # In-page fetches need no clicks; run them all before the modal pass, which arms the detail future
+                prefetched = await self._fetch_details(k for k in row_keys.values() if k)
 
-                        self._last_detail_json = None
-
-                        # --- Human-like pre-scroll before interacting ---
-                        await self._human_scroll_and_view(p)
-                        await asyncio.sleep(random.uniform(0.4, 1.6))  # pause as if reading row details
-
-                        # Move mouse off-row and back (like repositioning to focus)
-                        viewport = p.viewport_size
-                        if viewport:
-                            await p.mouse.move(viewport["width"] + random.randint(10, 60),
-                                               random.randint(40, viewport["height"] - 40))
-                            await asyncio.sleep(random.uniform(0.25, 0.9))
-
-                        # Get button box
-                        box = await detail_btn.bounding_box()
-                        if box:
-                            # Start from current "neutral" center position
-                            cur = await p.evaluate(
-                                "() => ({x: window.scrollX + (window.innerWidth/2), y: window.scrollY + (window.innerHeight/2)})"
-                            )
-                            target = (box["x"] + box["width"] / 2, box["y"] + box["height"] / 2)
-
-                            # Random exploratory hovers around the button edges (human hesitation)
-                            for _ in range(random.randint(1, 3)):
-                                hover_x = box["x"] + random.uniform(0, box["width"])
-                                hover_y = box["y"] + random.uniform(0, box["height"])
-                                await p.mouse.move(hover_x, hover_y, steps=random.randint(6, 12))
-                                await asyncio.sleep(random.uniform(0.2, 0.7))
-
-                            # Overshoot path then correction
-                            overshoot = (
-                                target[0] + random.uniform(-6, 12),
-                                target[1] + random.uniform(-6, 12),
-                            )
-                            await self._human_mouse_curve(p, (cur["x"], cur["y"]), overshoot,
-                                                          steps=random.randint(14, 28))
-                            await asyncio.sleep(random.uniform(0.5, 2.0))
-                            await self._human_mouse_curve(p, overshoot, target,
-                                                          steps=random.randint(6, 12))
-
-                            # Pause like “reading tooltip” before committing
-                            await asyncio.sleep(random.uniform(0.6, 2.4))
-
-                        try:
-                            async with p.expect_response(lambda r: "/api/devedores?id=" in r.url.lower(), timeout=30000) as resp_ctx:
-                                await detail_btn.click()
-                            resp = await resp_ctx.value
-                            data = await resp.json()
-                            self._last_detail_json = data
-                            logger.info("[DETAIL] API responded %s for %s", resp.status, resp.url)
-                        except Exception as e:
-                            logger.warning("[DETAIL] timeout waiting for /api/devedores?id=: %s", e)
-
-                        # Post-click behaviors: simulate viewing modal
-                        await asyncio.sleep(random.uniform(0.5, 1.5))
-                        await self._human_scroll_and_view(p)
-                        await asyncio.sleep(random.uniform(0.3, 0.8))
-                        for _ in range(40):
-                            if self._last_detail_json:
-                                break
-                            await asyncio.sleep(0.5)
-                        if not self._last_detail_json:
+                debtors: List[DebtorRow] = []
+                seen_cnpj: set[str] = set()
+                for idx, row_key in row_keys.items():
+                    try:
+                        # Skip the whole modal round-trip for CNPJs already collected
+                        if row_key and row_key in seen_cnpj:
+                            logger.debug("[ROW] %s already collected, skipping", row_key)
                             continue
-                        data_detail = self._last_detail_json
-                        cnpj = str(data_detail.get("id") or "").strip()
-                        inscriptions: List[str] = []
-                        try:
-                            for nat in data_detail.get("naturezas", []) or []:
-                                for deb in nat.get("debitos", []) or []:
-                                    if deb.get("numero"):
-                                        inscriptions.append(str(deb["numero"]).strip())
-                        except Exception:
-                            pass
-                        debtors.append(DebtorRow(cnpj=cnpj, inscriptions=inscriptions))
-                        logger.info("[ROW] %s -> %d inscriptions", cnpj, len(inscriptions))
-                        close_btn = await p.query_selector("button.close, .modal .btn-close")
-                        if close_btn:
-                            await close_btn.click()
-                            await asyncio.sleep(random.uniform(0.2, 0.9))
+                        parsed = None
+                        body = prefetched.get(row_key)
+                        if body is not None:
+                            try:
+                                parsed = await _parse_detail(body)
+                            except Exception as e:
+                                logger.debug("[DETAIL] unreadable prefetched body for %s: %s", row_key, e)
+                            # A 200 that is not this row's debtor (e.g. the API wanted its own id) is no answer
+                            if parsed is not None and _NON_DIGITS_RE.sub("", parsed[0]) != row_key:
+                                logger.debug("[DETAIL] prefetched body for %s does not match, falling back to modal", row_key)
+                                parsed = None
+                        if parsed is None:
+                            detail_btn = self._rows.nth(idx - 1).locator(_DETAIL_BTN_SEL).first
+                            body = await self._detail_via_modal(p, detail_btn, idx)
+                            if not body:
+                                continue
+                            parsed = await _parse_detail(body)
+                        cnpj, inscriptions = parsed
+                        key = _NON_DIGITS_RE.sub("", cnpj)
+                        if not key or key not in seen_cnpj:
+                            if key:
+                                seen_cnpj.add(key)
+                            debtors.append(DebtorRow(cnpj=cnpj, inscriptions=inscriptions))
+                            logger.info("[ROW] %s -> %d inscriptions", cnpj, len(inscriptions))
                     except Exception as row_err:
                         logger.error("[ROW] Error row %s: %s", idx, row_err)
 
-                unique = {}
-                for d in debtors:
-                    if d.cnpj not in unique:
-                        unique[d.cnpj] = d
-                return list(unique.values())
+                if self._stealth.level and not escalated:
+                    # A clean search means anti-bot checks are satisfied; relax for the next one
+                    self._stealth.level -= 1
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info("[SEARCH] Parsed %d debtor rows for query %r", len(debtors), name_query)
+                return debtors
 
         logger.error("[SEARCH] Exhausted all attempts without success")
         return []
\ No newline at end of file
@@ -1,101 +1,268 @@
 # regularize_client.py (async cleaned)
 from __future__ import annotations
-import logging
+import logging, asyncio, os, tempfile
 from pathlib import Path
-from typing import Optional
-from playwright.async_api import BrowserContext, Page
-from config import REGULARIZE_DOC, WAIT_LONG
+from typing import Optional, Dict, List, Sequence, Tuple, Union
+from playwright.async_api import BrowserContext, Page, Locator
+from config import REGULARIZE_BASE, REGULARIZE_DOC, WAIT_LONG, WAIT_MED, WAIT_SHORT, DARF_CONCURRENCY
+from browser_utils import block_resources
 
 logger = logging.getLogger("RegularizeClient")
 
+# Candidate selectors per form element, tried in order
+_SELECTORS: Dict[str, Tuple[str, ...]] = {
+    "cpf": ("input[name='cpfCnpj']", "input[id*='cpf']", "input[type='text']"),
+    "inscricao": ("input[name='inscricao']", "input[id*='inscr']", "input[type='text']"),
+    "consultar": ("button:has-text('Consultar')", "text=Consultar", "button[type='submit']"),
+    "emitir": ("button:has-text('Emitir DARF integral')", "text=Emitir DARF integral"),
+    "imprimir": ("button:has-text('Imprimir')", "text=Imprimir"),
+}
+
+# Subresources that can never carry the DARF PDF; skipped before touching headers
+_NON_PDF_RESOURCE_TYPES = {"script", "stylesheet", "image", "font", "media", "websocket", "manifest"}
+
+# form.reset() fires no input events, so nudge the SPA into syncing its model with the cleared fields
+_RESET_FORM_JS = """
+() => {
+    const f = document.querySelector('form');
+    if (!f) return false;
+    f.reset();
+    for (const el of f.elements) {
+        el.dispatchEvent(new Event('input', {bubbles: true}));
+        el.dispatchEvent(new Event('change', {bubbles: true}));
+    }
+    return true;
+}
+"""
+
+
+def _is_query_response(r) -> bool:
+    """expect_response predicate for the Consultar round-trip: a same-origin POST, not assets or beacons."""
+    req = r.request
+    return (
+        req.method == "POST"
+        and req.resource_type in ("xhr", "fetch", "document")
+        and r.url.startswith(REGULARIZE_BASE)
+    )
+
+
+_INSCR_TRANS = str.maketrans({" ": "_", "/": "-"})
+
+
+def _darf_filename(cnpj_digits_only: str, inscricao: str) -> str:
+    return f"DARF_{cnpj_digits_only}_{inscricao.translate(_INSCR_TRANS)}.pdf"
+
+
+def _spool_pdf(directory: Path, body: bytes) -> Path:
+    """Write `body` to a fresh hidden temp file in `directory` (unique even across pages)."""
+    fd, name = tempfile.mkstemp(dir=directory, prefix=".cap_", suffix=".pdf")
+    with os.fdopen(fd, "wb") as f:
+        f.write(body)
+    return Path(name)
+
 
 class RegularizeClient:
-    def __init__(self, context: BrowserContext, download_dir: Path):
+    """
+    One Regularize page, opened once and reused for every DARF of a batch.
+    Callers should keep a single client (or emitir_batch) per run rather than one per inscription.
+    """
+
+    def __init__(self, context: BrowserContext, download_dir: Path, make_dir: bool = True):
         self.context = context
         self.page: Optional[Page] = None
         self.download_dir = Path(download_dir)
-        self.download_dir.mkdir(parents=True, exist_ok=True)
-        self._last_pdf_bytes: Optional[bytes] = None
+        if make_dir:
+            self.download_dir.mkdir(parents=True, exist_ok=True)
+        self._captured_pdf: Optional[Path] = None  # temp file holding the last intercepted PDF
+        self._item_seq = 0  # bumped per DARF; a spool started for an older item is dropped
+        self._loc: Dict[str, List[Locator]] = {}  # built once per page in open()
 
     async def open(self):
         """Open Regularize page and attach PDF capture listener."""
         self.page = await self.context.new_page()
-        self.page.set_default_timeout(WAIT_LONG)
-
-        async def on_response(resp):
-            try:
-                ctype = (resp.headers.get("content-type") or "").lower()
-                if "application/pdf" in ctype:
-                    logger.debug("[PDF] Captured response: %s", resp.url)
-                    try:
-                        self._last_pdf_bytes = await resp.body()
-                    except Exception as e:
-                        logger.warning("[PDF] Failed to capture body: %s", e)
-                        self._last_pdf_bytes = None
-            except Exception as e:
-                logger.debug("[PDF] Response listener error: %s", e)
-
-        self.page.on("response", on_response)
+        # Selector probes are expected to miss: fail them fast, keep navigation/download patient
+        self.page.set_default_timeout(WAIT_SHORT)
+        self.page.set_default_navigation_timeout(WAIT_LONG)
+        await self.page.route("**/*", block_resources)
+        self.page.on("response", self._on_response)
+        self._loc = {name: [self.page.locator(sel) for sel in sels] for name, sels in _SELECTORS.items()}
         await self.page.goto(REGULARIZE_DOC, wait_until="domcontentloaded")
         logger.info("[OPEN] Loaded Regularize portal: %s", REGULARIZE_DOC)
 
+    async def _on_response(self, resp) -> None:
+        """Page-wide response hook: spool PDF responses to a temp file."""
+        if resp.request.resource_type in _NON_PDF_RESOURCE_TYPES:
+            # The PDF arrives as a document/xhr/fetch; nothing to read here, not even headers
+            return
+        seq = self._item_seq  # read before any await: the item this response belongs to
+        try:
+            ctype = (resp.headers.get("content-type") or "").lower()
+            if "application/pdf" in ctype:
+                logger.debug("[PDF] Captured response: %s", resp.url)
+                try:
+                    body = await resp.body()
+                    # Multi-MB write off the event loop: other pages of the batch keep running
+                    tmp = await asyncio.to_thread(_spool_pdf, self.download_dir, body)
+                    if seq != self._item_seq:
+                        # The next DARF started while this one was spooling; it is not that item's PDF
+                        tmp.unlink(missing_ok=True)
+                        return
+                    self._discard_captured()
+                    self._captured_pdf = tmp
+                except Exception as e:
+                    logger.warning("[PDF] Failed to capture body: %s", e)
+                    self._discard_captured()
+        except Exception as e:
+            logger.debug("[PDF] Response listener error: %s", e)
+
+    def _discard_captured(self) -> None:
+        """Remove the pending intercepted PDF, if any."""
+        if self._captured_pdf is not None:
+            self._captured_pdf.unlink(missing_ok=True)
+            self._captured_pdf = None
+
+    async def close(self):
+        """Close the Regularize page and drop any pending intercepted PDF."""
+        self._discard_captured()
+        if self.page is not None:
+            await self.page.close()
+            self.page = None
+
+    async def _result_cleared(self) -> bool:
+        """True once no Emitir DARF button from an earlier query is visible."""
+        try:
+            await self._loc["emitir"][0].first.wait_for(state="hidden", timeout=WAIT_SHORT)
+            return True
+        except Exception:
+            return False
+
+    async def reset_form(self) -> None:
+        """
+        Clear the query form in place and make sure the previous result is gone.
+        Reloads the portal when the form is missing or an earlier Emitir/Imprimir is still shown.
+        """
+        assert self.page is not None
+        found = await self.page.evaluate(_RESET_FORM_JS)
+        stale = found and (
+            await self._loc["emitir"][0].first.is_visible()
+            or await self._loc["imprimir"][0].first.is_visible()
+        )
+        if found and not stale:
+            return
+        await self.page.goto(REGULARIZE_DOC, wait_until="domcontentloaded")
+        logger.debug("[OPEN] %s, reloaded Regularize portal", "Previous result shown" if found else "Form missing")
+        # The Emitir wait after Consultar must only ever see this query's button
+        if not await self._result_cleared():
+            raise RuntimeError("Previous DARF result still shown after reloading the Regularize portal")
+
+    async def emitir_batch(
+        self, items: Sequence[Tuple[str, str]], concurrency: int = DARF_CONCURRENCY
+    ) -> List[Union[Path, Exception]]:
+        """
+        Emit DARFs for (cnpj_digits_only, inscricao) pairs across up to `concurrency` pages.
+        Returns, in input order, the PDF path or the exception raised for each item.
+        """
+        workers = [self] + [
+            RegularizeClient(self.context, self.download_dir, make_dir=False)  # dir made by self
+            for _ in range(min(concurrency, len(items)) - 1)
+        ]
+        results: List[Union[Path, Exception]] = [RuntimeError("DARF not attempted") for _ in items]
+        queue: asyncio.Queue = asyncio.Queue()
+        for i, item in enumerate(items):
+            queue.put_nowait((i, item))
+
+        async def _drain(worker: RegularizeClient) -> None:
+            # Each page handles one DARF at a time; its PDF listener state is per client
+            if worker.page is None:
+                try:
+                    await worker.open()
+                except Exception as e:
+                    logger.warning("[BATCH] Could not open extra Regularize page: %s", e)
+                    return
+            while not queue.empty():
+                i, (cnpj, inscricao) = queue.get_nowait()
+                try:
+                    results[i] = await worker.emitir_darf_integral(cnpj, inscricao)
+                except Exception as e:
+                    results[i] = e
+
+        try:
+            await asyncio.gather(*(_drain(w) for w in workers))
+        finally:
+            for w in workers[1:]:
+                try:
+                    await w.close()
+                except Exception:
+                    pass
+        return results
+
     async def emitir_darf_integral(self, cnpj_digits_only: str, inscricao: str) -> Path:
         """Fill form and download DARF PDF asynchronously."""
         assert self.page is not None
         p = self.page
+        # A PDF that landed (or is still spooling) from the previous emission is not this item's
+        self._item_seq += 1
+        self._discard_captured()
+        await self.reset_form()
 
-        async def safe_fill(selectors: list[str], value: str) -> bool:
-            for sel in selectors:
+        async def safe_fill(name: str, value: str) -> bool:
+            for loc in self._loc[name]:
                 try:
-                    loc = p.locator(sel)
-                    if await loc.count() > 0:
-                        if await loc.count() > 1:
+                    n = await loc.count()
+                    if n > 0:
+                        if n > 1:
                             await loc.nth(1).fill(value)
                         else:
                             await loc.fill(value)
-                        logger.debug("[FORM] Filled %s with %s", sel, value)
+                        logger.debug("[FORM] Filled %s with %s", name, value)
                         return True
                 except Exception:
                     continue
             return False
 
-        async def safe_click(selectors: list[str]) -> bool:
-            for sel in selectors:
+        async def safe_click(name: str) -> bool:
+            for loc in self._loc[name]:
                 try:
-                    loc = p.locator(sel)
                     if await loc.count() > 0:
                         await loc.click()
-                        logger.debug("[CLICK] Clicked %s", sel)
+                        logger.debug("[CLICK] Clicked %s", name)
                         return True
                 except Exception:
                     continue
             return False
 
         # Fill CPF/CNPJ
-        await safe_fill(["input[name='cpfCnpj']", "input[id*='cpf']", "input[type='text']"], cnpj_digits_only)
+        await safe_fill("cpf", cnpj_digits_only)
 
         # Fill inscrição
-        await safe_fill(["input[name='inscricao']", "input[id*='inscr']", "input[type='text']"], inscricao)
+        await safe_fill("inscricao", inscricao)
 
-        # Consultar
-        await safe_click(["button:has-text('Consultar')", "text=Consultar", "button[type='submit']"])
-        await p.wait_for_timeout(1200)
+        # Consultar: without this query's response any Emitir button on screen is not ours
+        try:
+            async with p.expect_response(_is_query_response, timeout=WAIT_MED):
+                await safe_click("consultar")
+        except Exception as e:
+            raise RuntimeError(f"No Consultar response for {cnpj_digits_only} / {inscricao}") from e
+        # Proceed as soon as the query result renders the Emitir button
+        try:
+            await self._loc["emitir"][0].first.wait_for(state="visible", timeout=WAIT_MED)
+        except Exception:
+            logger.debug("[FORM] Emitir DARF integral not visible after Consultar")
 
         # Emitir DARF
-        await safe_click(["button:has-text('Emitir DARF integral')", "text=Emitir DARF integral"])
+        await safe_click("emitir")
 
         pdf_path: Optional[Path] = None
 
         # Try Imprimir → download
         try:
-            for btn in ["button:has-text('Imprimir')", "text=Imprimir"]:
+            for btn in self._loc["imprimir"]:
                 try:
-                    if await p.locator(btn).count() > 0:
+                    if await btn.count() > 0:
                         async with p.expect_download(timeout=WAIT_LONG) as dl_info:
-                            await p.click(btn)
+                            await btn.first.click()
                         download = await dl_info.value
-                        fname = f"DARF_{cnpj_digits_only}_{inscricao.replace(' ', '_').replace('/', '-')}.pdf"
-                        target = self.download_dir / fname
+                        target = self.download_dir / _darf_filename(cnpj_digits_only, inscricao)
                         await download.save_as(str(target))
                         pdf_path = target
                         logger.info("[DARF] Downloaded via expect_download: %s", target)
@@ -106,14 +273,15 @@ class RegularizeClient:
         except Exception:
             logger.exception("[DARF] expect_download attempt failed")
 
-        # Fallback: intercepted PDF bytes
-        if pdf_path is None and self._last_pdf_bytes:
-            fname = f"DARF_{cnpj_digits_only}_{inscricao.replace(' ', '_').replace('/', '-')}.pdf"
-            target = self.download_dir / fname
-            with open(target, "wb") as f:
-                f.write(self._last_pdf_bytes)
+        # Fallback: intercepted PDF, already on disk
+        if pdf_path is None and self._captured_pdf is not None:
+            target = self.download_dir / _darf_filename(cnpj_digits_only, inscricao)
+            os.replace(self._captured_pdf, target)
+            self._captured_pdf = None
             pdf_path = target
             logger.info("[DARF] Saved from intercepted PDF response: %s", target)
+        else:
+            self._discard_captured()
 
         if pdf_path is None:
             raise RuntimeError(f"❌ Could not obtain DARF PDF for {cnpj_digits_only} / {inscricao}")
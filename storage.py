@@ -1,25 +1,60 @@
 # storage.py
 from __future__ import annotations
-from dataclasses import dataclass, asdict
-from typing import List
-import pandas as pd
+import csv
+import orjson
+from dataclasses import dataclass, fields
+from operator import attrgetter
+from typing import List, Tuple
 from pathlib import Path
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.pool import StaticPool
 
-@dataclass
+_UPSERT_CHUNK = 500
+
+# Built once at import; each call reuses the same statement objects
+_UPSERT_SQL = text("""
+    INSERT INTO inscriptions (cnpj, inscription_number)
+    VALUES (:cnpj, :inscription_number)
+    ON CONFLICT(cnpj, inscription_number) DO NOTHING
+""")
+_LINK_SQL = text(
+    "INSERT OR IGNORE INTO darfs (cnpj, inscription_number, pdf_path) VALUES (:c, :i, :p)"
+)
+
+@dataclass(slots=True)
 class Inscription:
     cnpj: str
     inscription_number: str
 
 def save_as_csv_json(inscriptions: List[Inscription], out_dir: Path) -> None:
-    out_dir.mkdir(parents=True, exist_ok=True)
-    rows = [asdict(i) for i in inscriptions]
-    df = pd.DataFrame(rows)
-    df.to_csv(out_dir / "inscriptions.csv", index=False)
-    df.to_json(out_dir / "inscriptions.json", orient="records", force_ascii=False, indent=2)
+    """Write inscriptions.csv/.json into `out_dir`, which the caller has already created."""
+    # Plain attribute reads per row; orjson serializes the dataclasses natively
+    names = [f.name for f in fields(inscriptions[0])] if inscriptions else []
+    with (out_dir / "inscriptions.csv").open("w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f, lineterminator="\n")  # pandas to_csv line endings
+        w.writerow(names)
+        if names:
+            w.writerows(map(attrgetter(*names), inscriptions))
+    (out_dir / "inscriptions.json").write_bytes(orjson.dumps(inscriptions, option=orjson.OPT_INDENT_2))
 
 def init_db(db_path: Path):
-    engine = create_engine(f"sqlite:///{db_path}")
+    # Local single-writer file: keep one connection open for the whole run
+    engine = create_engine(
+        f"sqlite:///{db_path}",
+        poolclass=StaticPool,
+        connect_args={"check_same_thread": False},
+    )
+
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_conn, _record):
+        # synchronous/temp_store/cache_size are per-connection; WAL sticks to the file
+        cur = dbapi_conn.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.execute("PRAGMA temp_store=MEMORY")
+        cur.execute("PRAGMA cache_size=-65536")
+        cur.close()
+
     with engine.begin() as conn:
         conn.execute(text("""
             CREATE TABLE IF NOT EXISTS inscriptions (
@@ -37,23 +72,38 @@ def init_db(db_path: Path):
                 pdf_path TEXT
             );
         """))
+        has_index = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_darfs_cnpj_inscr'"
+        )).first()
+        if not has_index:
+            # One-time migration: databases created before the index may hold repeated links
+            conn.execute(text("""
+                DELETE FROM darfs WHERE id NOT IN (
+                    SELECT MIN(id) FROM darfs GROUP BY cnpj, inscription_number, pdf_path
+                );
+            """))
+            conn.execute(text("""
+                CREATE UNIQUE INDEX idx_darfs_cnpj_inscr
+                ON darfs(cnpj, inscription_number, pdf_path);
+            """))
     return engine
 
 def upsert_inscriptions(engine, inscriptions: List[Inscription]):
-    rows = [asdict(i) for i in inscriptions]
+    rows = [{"cnpj": i.cnpj, "inscription_number": i.inscription_number} for i in inscriptions]
     if not rows:
         return
-
-    sql = """
-        INSERT INTO inscriptions (cnpj, inscription_number)
-        VALUES (:cnpj, :inscription_number)
-        ON CONFLICT(cnpj, inscription_number) DO NOTHING
-    """
     with engine.begin() as conn:
-        conn.execute(text(sql), rows)
+        # One transaction, bounded executemany batches
+        for i in range(0, len(rows), _UPSERT_CHUNK):
+            conn.execute(_UPSERT_SQL, rows[i:i + _UPSERT_CHUNK])
 
 def link_darf(engine, cnpj: str, inscription_number: str, pdf_path: Path):
+    link_darfs(engine, [(cnpj, inscription_number, pdf_path)])
+
+def link_darfs(engine, items: List[Tuple[str, str, Path]]):
+    """Link (cnpj, inscription_number, pdf_path) triples in a single transaction."""
+    rows = [{"c": c, "i": i, "p": str(p)} for c, i, p in items]
+    if not rows:
+        return
     with engine.begin() as conn:
-        conn.execute(text(
-            "INSERT INTO darfs (cnpj, inscription_number, pdf_path) VALUES (:c, :i, :p)",
-        ), {"c": cnpj, "i": inscription_number, "p": str(pdf_path)})
\ No newline at end of file
+        conn.execute(_LINK_SQL, rows)
\ No newline at end of file